@@ -9,6 +9,8 @@ from typing import Optional
 class Settings:
     """설정 관리 클래스"""
     
+    __slots__ = ('SERVER_URL', 'DISCORD_HEART_URL', 'NOTIFY_HEALTHY_HOURLY')
+    
     def __init__(self):
         # 서버 URL 설정 (기본값: 로컬 개발 서버)
         self.SERVER_URL = os.getenv(
@@ -19,6 +21,9 @@ class Settings:
         # 디스코드 웹훅 URL
         self.DISCORD_HEART_URL = os.getenv('DISCORD_HEART_URL')
         
+        # 정상 상태에서도 정시 리포트 전송 여부 (기본값: 전송 안 함)
+        self.NOTIFY_HEALTHY_HOURLY = os.getenv('NOTIFY_HEALTHY_HOURLY', '0') == '1'
+        
         # 검증
         self._validate_settings()
     
@@ -3,14 +3,27 @@
 독립적인 API 모니터링 스크립트
 FastAPI 서버와 별개로 실행되어 서버 상태를 체크하고 디스코드로 알림 전송
 """
+import argparse
 import asyncio
 import aiohttp
-import json
 import logging
+import time
 from datetime import datetime
-import pytz
+from typing import Optional
+from zoneinfo import ZoneInfo
 from config import settings
-import requests
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj):
+        # aiohttp의 json_serialize는 str을 기대하므로 bytes를 디코딩
+        return orjson.dumps(obj).decode()
+except ImportError:  # orjson 미설치 시 표준 json 사용
+    import json
+    _json_loads = json.loads
+    _json_dumps = json.dumps
 
 # 로깅 설정 (콘솔에만 출력)
 logging.basicConfig(
@@ -20,126 +33,280 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 한국 시간대
+KST = ZoneInfo('Asia/Seoul')
+
+# API 헬스체크 타임아웃 (연결 단계는 짧게 잡아 서버 다운을 빨리 감지)
+API_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3, sock_connect=3)
+
+# 디스코드 알림 메시지 템플릿 (상태, 상태 변경 여부)
+TEMPLATES = {
+    ('healthy', True): (
+        "💚 **API 복구됨** 💚\n"
+        "🕐 **시간**: {ts}\n"
+        "✅ **상태**: 정상 작동 중\n"
+        "⚡ **응답시간**: {rt}\n"
+        "🌐 **서버**: {url}"
+    ),
+    ('healthy', False): (
+        "💚 **API 정시 체크** 💚\n"
+        "🕐 **시간**: {ts}\n"
+        "✅ **상태**: 정상 작동 중\n"
+        "⚡ **응답시간**: {rt}\n"
+        "🌐 **서버**: {url}"
+    ),
+    ('down', None): (
+        "🔴 **API 서버 다운** 🔴\n"
+        "🕐 **시간**: {ts}\n"
+        "💀 **상태**: 서버 응답 없음\n"
+        "❌ **에러**: {err}\n"
+        "🌐 **서버**: {url}"
+    ),
+    ('unhealthy', None): (
+        "⚠️ **API 문제 발생** ⚠️\n"
+        "🕐 **시간**: {ts}\n"
+        "🟡 **상태**: 서버 응답 불량\n"
+        "❌ **에러**: {err}\n"
+        "🌐 **서버**: {url}"
+    ),
+    ('error', None): (
+        "💥 **모니터링 스크립트 에러** 💥\n"
+        "🕐 **시간**: {ts}\n"
+        "❌ **에러**: {err}\n"
+        "🌐 **서버**: {url}"
+    ),
+}
+
 class APIMonitor:
     def __init__(self):
         self.api_url = f"{settings.SERVER_URL}"
+        self._health_url = f"{self.api_url.rstrip('/')}/health"
         self.discord_webhook = settings.DISCORD_HEART_URL
         self.check_interval = 60  # 1분마다 체크
         self.last_status = None
+        self.notify_healthy_hourly = settings.NOTIFY_HEALTHY_HOURLY
+        self.alert_threshold = 2  # 연속 이상 횟수가 이 값에 도달해야 알림
+        self.failure_count = 0
+        self.retry_delay = 5  # 단일 체크에서 연결 실패 시 재시도 대기 (초)
+        self._api_session: Optional[aiohttp.ClientSession] = None
+        self._discord_session: Optional[aiohttp.ClientSession] = None
+    
+    async def _get_api_session(self):
+        """API 서버용 HTTP 세션 반환 (없거나 닫혀 있으면 새로 생성)"""
+        if self._api_session is None or self._api_session.closed:
+            self._api_session = aiohttp.ClientSession(
+                timeout=API_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit_per_host=1, keepalive_timeout=120, ttl_dns_cache=300)
+            )
+        return self._api_session
+    
+    async def _get_discord_session(self):
+        """디스코드 웹훅용 HTTP 세션 반환 (없거나 닫혀 있으면 새로 생성)"""
+        if self._discord_session is None or self._discord_session.closed:
+            self._discord_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10),
+                json_serialize=_json_dumps,
+                connector=aiohttp.TCPConnector(limit_per_host=2, keepalive_timeout=30)
+            )
+        return self._discord_session
+    
+    async def aclose(self):
+        """HTTP 세션 정리"""
+        if self._api_session:
+            await self._api_session.close()
+        if self._discord_session:
+            await self._discord_session.close()
         
+    def _next_tick(self, last_tick):
+        """last_tick 다음 체크 시각 (벽시계 기준 check_interval 격자)"""
+        next_tick = (time.time() // self.check_interval + 1) * self.check_interval
+        # 시계 보정 등으로 격자 직전에 깨어났다면 같은 격자를 다시 잡지 않고 한 칸 건너뜀
+        # (두 체크가 몇 ms 간격으로 실행되어 연속 실패 판정이 무력화되는 것 방지)
+        if next_tick - last_tick < self.check_interval / 2:
+            next_tick += self.check_interval
+        return next_tick
+    
     async def check_api_health(self):
         """API 헬스체크"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.api_url}/health", timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            'status': 'healthy',
-                            'response_time': response.headers.get('X-Process-Time', 'unknown'),
-                            'data': data
-                        }
-                    else:
-                        return {
-                            'status': 'unhealthy',
-                            'error': f'HTTP {response.status}',
-                        }
+            session = await self._get_api_session()
+            async with session.get(self._health_url) as response:
+                if response.status == 200:
+                    data = await response.json(loads=_json_loads)
+                    return {
+                        'status': 'healthy',
+                        'response_time': response.headers.getone('X-Process-Time', 'unknown'),
+                        'data': data
+                    }
+                else:
+                    return {
+                        'status': 'unhealthy',
+                        'error': f'HTTP {response.status}',
+                    }
         except aiohttp.ClientConnectorError:
             return {
                 'status': 'down',
                 'error': 'Connection refused - 서버가 실행되지 않음'
             }
+        except aiohttp.ServerTimeoutError:
+            # 연결 단계 타임아웃 (패킷을 버리는 호스트 등) - asyncio.TimeoutError보다 먼저 처리
+            return {
+                'status': 'down',
+                'error': f'Connection timeout ({API_TIMEOUT.connect}s) - 서버 응답 없음'
+            }
         except asyncio.TimeoutError:
             return {
                 'status': 'unhealthy',
-                'error': 'Request timeout (10s)'
+                'error': f'Request timeout ({API_TIMEOUT.total}s)'
             }
-        except Exception as e:
+        except (aiohttp.ClientError, ValueError) as e:
+            # 그 밖의 HTTP 오류나 잘못된 응답 본문 (예상치 못한 예외는 호출자에게 전달)
             return {
                 'status': 'unhealthy', 
                 'error': str(e)
             }
     
-    def send_discord_notification(self, message):
-        """디스코드 알림 전송 (동기 버전)"""
+    async def send_discord_notification(self, message):
+        """디스코드 알림 전송"""
         try:
             payload = {
                 "content": message,
                 "username": "독립모니터봇"
             }
             
-            response = requests.post(
-                self.discord_webhook, 
-                data=json.dumps(payload), 
-                headers={"Content-Type": "application/json"},
-                timeout=10
-            )
-            
-            if response.status_code == 204:
-                logger.info("디스코드 알림 전송 성공")
-            else:
-                logger.error(f"디스코드 알림 전송 실패: {response.status_code}")
+            session = await self._get_discord_session()
+            async with session.post(self.discord_webhook, json=payload) as response:
+                if response.status == 204:
+                    logger.info("디스코드 알림 전송 성공")
+                else:
+                    logger.error("디스코드 알림 전송 실패: %s", response.status)
                 
         except Exception as e:
-            logger.error(f"디스코드 알림 전송 에러: {e}")
+            logger.error("디스코드 알림 전송 에러: %s", e)
+    
+    def _render(self, key, **fields):
+        """템플릿에 공통 필드(시간, 서버)를 채워 메시지 생성"""
+        timestamp = datetime.now(KST).strftime('%Y-%m-%d %H:%M:%S KST')
+        return TEMPLATES[key].format(ts=timestamp, url=self.api_url, **fields)
+    
+    def _format_alert(self, status, status_changed, health_result, hourly_report=False):
+        """알림 메시지 생성 (알림을 보낼 필요가 없으면 None)"""
+        # 상태 변경 시, 또는 정시에 (정상 상태는 설정된 경우에만) 알림
+        should_send = status_changed or (
+            hourly_report and (status != 'healthy' or self.notify_healthy_hourly)
+        )
+        if not should_send:
+            return None
+        
+        key = (status, status_changed if status == 'healthy' else None)
+        return self._render(
+            key,
+            rt=health_result.get('response_time', 'unknown'),
+            err=health_result.get('error', 'Unknown error')
+        )
+    
+    async def _flush_alerts(self, messages):
+        """여러 디스코드 알림을 순서대로 전송 (전송 사이마다 이벤트 루프에 양보)"""
+        for message in messages:
+            await self.send_discord_notification(message)
+            await asyncio.sleep(0)
+    
+    async def _process_tick(self, tick):
+        """루프 1회분 헬스 체크 및 알림 처리 (tick: 예정된 체크 시각)"""
+        health_result = await self.check_api_health()
+        current_status = health_result['status']
+        logger.info("Status: %s", current_status)
+        
+        if current_status == 'healthy':
+            self.failure_count = 0
+        else:
+            self.failure_count += 1
+        
+        # 일시적인 이상은 연속 횟수가 임계값에 도달할 때까지 무시
+        if current_status != 'healthy' and self.failure_count < self.alert_threshold:
+            logger.warning(
+                "일시적 이상 감지 (%d/%d): %s",
+                self.failure_count, self.alert_threshold,
+                health_result.get('error', 'Unknown error')
+            )
+            return
+        
+        # 최초 체크는 정상 상태에서 출발한 것으로 간주
+        status_changed = current_status != (self.last_status or 'healthy')
+        
+        # 정시 여부는 예정된 체크 시각의 epoch 초로 판단 (KST는 UTC와 정시 단위로 차이나므로 동일)
+        hourly_report = round(tick) % 3600 < self.check_interval
+        
+        message = self._format_alert(current_status, status_changed, health_result, hourly_report)
+        if message:
+            await self._flush_alerts([message])
+        
+        self.last_status = current_status
+    
+    async def monitor_loop(self):
+        """지속 모니터링 루프 (장기 실행용)"""
+        logger.info("API 모니터링 시작: %s (%d초 간격)", self.api_url, self.check_interval)
+        
+        # 첫 체크는 대기 없이 바로 실행되어 커넥션 풀과 DNS 캐시를 미리 채움
+        tick = time.time()
+        while True:
+            try:
+                await self._process_tick(tick)
+            except Exception as e:
+                logger.error("모니터링 에러: %s", e)
+            
+            # 벽시계 기준 다음 체크 시각까지 대기 (작업 시간만큼 밀리지 않음)
+            tick = self._next_tick(tick)
+            await asyncio.sleep(max(0, tick - time.time()))
     
     async def run_single_check(self):
         """단일 헬스 체크 실행 (GitHub Actions용)"""
         logger.info("API 헬스 체크 실행...")
-        logger.info(f"서버 URL: {self.api_url}")
-        logger.info(f"디스코드 웹훅 전체 URL: {self.discord_webhook}")
+        logger.info("서버 URL: %s", self.api_url)
+        logger.info("디스코드 웹훅: ***%s", self.discord_webhook[-8:])
         
         try:
             health_result = await self.check_api_health()
             current_status = health_result['status']
             
-            # 한국 시간대로 변환
-            kst = pytz.timezone('Asia/Seoul')
-            now_kst = datetime.now(kst)
-            timestamp = now_kst.strftime('%Y-%m-%d %H:%M:%S KST')
+            # 연결 실패는 일시적일 수 있으므로 한 번 더 확인
+            if current_status == 'down':
+                logger.warning("서버 연결 실패 - %d초 후 재시도", self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
+                health_result = await self.check_api_health()
+                current_status = health_result['status']
             
-            # 통신이 안될 때만 디스코드로 알림
-            logger.info(f"Status: {current_status}")
+            logger.info("Status: %s", current_status)
             
-            if current_status != 'healthy':
-                if current_status == 'down':
-                    message = (
-                        f"🔴 **API 서버 다운** 🔴\n"
-                        f"🕐 **시간**: {timestamp}\n"
-                        f"💀 **상태**: 서버 응답 없음\n"
-                        f"❌ **에러**: {health_result.get('error', 'Unknown error')}\n"
-                        f"🌐 **서버**: {self.api_url}"
-                    )
-                else:  # unhealthy
-                    message = (
-                        f"⚠️ **API 문제 발생** ⚠️\n"
-                        f"🕐 **시간**: {timestamp}\n"
-                        f"🟡 **상태**: 서버 응답 불량\n"
-                        f"❌ **에러**: {health_result.get('error', 'Unknown error')}\n"
-                        f"🌐 **서버**: {self.api_url}"
-                    )
-                
-                self.send_discord_notification(message)
+            # 통신이 안될 때만 디스코드로 알림 (매 실행을 정상 상태에서 출발한 것으로 간주)
+            message = self._format_alert(current_status, current_status != 'healthy', health_result)
+            if message:
+                await self.send_discord_notification(message)
             else:
                 logger.info("서버 정상 - 디스코드 알림 생략")
             
         except Exception as e:
-            logger.error(f"모니터링 에러: {e}")
-            # 에러 발생시에도 디스코드로 알림
-            kst = pytz.timezone('Asia/Seoul')
-            now_kst = datetime.now(kst)
-            timestamp = now_kst.strftime('%Y-%m-%d %H:%M:%S KST')
-            error_message = (
-                f"💥 **모니터링 스크립트 에러** 💥\n"
-                f"🕐 **시간**: {timestamp}\n"
-                f"❌ **에러**: {str(e)}\n"
-                f"🌐 **서버**: {self.api_url}"
-            )
-            self.send_discord_notification(error_message)
+            logger.error("모니터링 에러: %s", e)
+            # 에러 발생시에도 디스코드로 알림 후, 실행이 실패로 기록되도록 다시 발생
+            error_message = self._render(('error', None), err=str(e))
+            await self.send_discord_notification(error_message)
+            raise
 
 async def main():
+    parser = argparse.ArgumentParser(description="API 헬스 체크 모니터")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--once', action='store_true', help="단일 체크 후 종료 (기본값, GitHub Actions용)")
+    mode.add_argument('--loop', action='store_true', help="종료하지 않고 지속 모니터링 (장기 실행용)")
+    args = parser.parse_args()
+    
     monitor = APIMonitor()
-    await monitor.run_single_check()
+    try:
+        if args.loop:
+            await monitor.monitor_loop()
+        else:
+            await monitor.run_single_check()
+    finally:
+        await monitor.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file